@@ -11,21 +11,29 @@ __author__ = "ProgrammerPlus1998"
 from .core import (
     NacosService,
     nacos_registry,
+    close_shared_clients,
+    flush_registrations,
     DEFAULT_REGISTER_RETRIES,
     DEFAULT_REGISTER_RETRY_DELAY,
+    DEFAULT_REGISTER_RETRY_CAP,
     DEFAULT_HEARTBEAT_INTERVAL,
     DEFAULT_HEARTBEAT_MAX_FAILURES,
     DEFAULT_HEARTBEAT_RETRY_DELAY,
     DEFAULT_UNREGISTER_TIMEOUT,
+    DEFAULT_SHUTDOWN_TIMEOUT,
 )
 
 __all__ = [
     "NacosService",
     "nacos_registry",
+    "close_shared_clients",
+    "flush_registrations",
     "DEFAULT_REGISTER_RETRIES",
     "DEFAULT_REGISTER_RETRY_DELAY",
+    "DEFAULT_REGISTER_RETRY_CAP",
     "DEFAULT_HEARTBEAT_INTERVAL",
     "DEFAULT_HEARTBEAT_MAX_FAILURES",
     "DEFAULT_HEARTBEAT_RETRY_DELAY",
     "DEFAULT_UNREGISTER_TIMEOUT",
+    "DEFAULT_SHUTDOWN_TIMEOUT",
 ]
@@ -2,23 +2,235 @@
 Core functionality for Nacos service registration and management.
 """
 
-import nacos
+import heapq
+import itertools
+import logging
+import queue
+import random
 import threading
 import time
 import signal
 import sys
 import traceback
-import asyncio
-from functools import wraps
-from typing import Callable, Optional, Dict, Any
+from functools import partial, wraps
+from typing import Callable, Optional, Dict, Any, List, Tuple
 
 # Default configuration constants
 DEFAULT_REGISTER_RETRIES = 3
 DEFAULT_REGISTER_RETRY_DELAY = 2
+DEFAULT_REGISTER_RETRY_CAP = 30
 DEFAULT_HEARTBEAT_INTERVAL = 5
 DEFAULT_HEARTBEAT_MAX_FAILURES = 5
 DEFAULT_HEARTBEAT_RETRY_DELAY = 2
 DEFAULT_UNREGISTER_TIMEOUT = 2
+DEFAULT_SHUTDOWN_TIMEOUT = 10
+
+_LOG_LEVELS = ("info", "warning", "error", "debug")
+
+# Process-wide NacosClient cache, keyed by (nacos_addr, namespace, username, password)
+_CLIENT_CACHE: Dict[tuple, Any] = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+
+def _get_shared_client(nacos_addr: str, namespace: Optional[str], username: Optional[str], password: Optional[str]):
+    """Return the cached NacosClient for these connection settings, creating it if needed."""
+    key = (nacos_addr, namespace, username, password)
+    with _CLIENT_CACHE_LOCK:
+        client = _CLIENT_CACHE.get(key)
+        if client is None:
+            # Imported lazily: the SDK is heavy and only needed once a service actually connects
+            try:
+                import nacos
+            except ImportError:
+                raise ImportError("nacos-sdk-python is not installed. Install it with: pip install nacos-sdk-python") from None
+            client = nacos.NacosClient(
+                nacos_addr,
+                namespace=namespace,
+                username=username,
+                password=password
+            )
+            _CLIENT_CACHE[key] = client
+        return client
+
+
+def close_shared_clients() -> None:
+    """Drop all cached NacosClient instances so that new services create fresh ones."""
+    with _CLIENT_CACHE_LOCK:
+        _CLIENT_CACHE.clear()
+
+
+# Delay before the decorator registers a service, to ensure it has fully started (seconds)
+_STARTUP_DELAY = 5
+
+# Services queued by NacosService.register_deferred(), mapped to the monotonic time they become
+# ready; registered together by flush_registrations()
+_PENDING_REGISTRATIONS: Dict["NacosService", float] = {}
+_PENDING_LOCK = threading.Lock()
+
+
+def _start_deferred(service: "NacosService") -> None:
+    try:
+        service.start()
+    except Exception as e:
+        service._log("error", f"✗ Failed to register service: {e}")
+
+
+def flush_registrations() -> int:
+    """
+    Register all queued services whose register_deferred() delay has expired, in one concurrent round.
+
+    Services that are not ready yet stay queued for a later flush.
+
+    nacos-sdk-python's NacosClient has no batch registration API, so the queued
+    registrations are issued in parallel (up to _HeartbeatScheduler.SEND_WORKERS at a
+    time) over their shared clients instead of one round trip after another.
+
+    Returns:
+        Number of services flushed
+    """
+    with _PENDING_LOCK:
+        now = time.monotonic()
+        pending = [svc for svc, ready_at in _PENDING_REGISTRATIONS.items() if ready_at <= now]
+        for svc in pending:
+            del _PENDING_REGISTRATIONS[svc]
+    if not pending:
+        return 0
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = min(len(pending), _HeartbeatScheduler.SEND_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nacosx-register") as pool:
+        list(pool.map(_start_deferred, pending))
+    return len(pending)
+
+
+class _HeartbeatScheduler:
+    """
+    Single background thread that schedules heartbeats for every started NacosService.
+
+    Services sit in a min-heap keyed by their next monotonic fire time, so any number of
+    instances costs one sleeping thread instead of one thread per instance. The blocking
+    sends are handed to up to SEND_WORKERS daemon worker threads (started on demand) so a
+    slow or unreachable cluster only delays its own services and never holds up process exit.
+    """
+
+    SEND_WORKERS = 16
+
+    _instance: Optional["_HeartbeatScheduler"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, "NacosService", float]] = []  # (fire time, seq, service, grid slot)
+        self._cond = threading.Condition(threading.Lock())
+        self._seq = itertools.count()
+        self._active: Dict[int, int] = {}  # id(service) -> seq of its live heap entry
+        self._in_flight: Dict[int, int] = {}  # id(service) -> heartbeats currently being sent
+        self._thread: Optional[threading.Thread] = None
+        self._send_queue: "queue.Queue[Tuple[float, int, NacosService, float]]" = queue.Queue()
+        self._workers = 0
+        self._idle_workers = 0
+
+    @classmethod
+    def instance(cls) -> "_HeartbeatScheduler":
+        """Return the process-wide scheduler."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def register(self, service: "NacosService") -> None:
+        """Schedule heartbeats for a service, starting one interval from now."""
+        if not service.ephemeral:
+            return  # Permanent instances don't need heartbeat
+        with self._cond:
+            seq = next(self._seq)
+            self._active[id(service)] = seq
+            first = time.monotonic() + service.heartbeat_interval
+            entry = (first, seq, service, first)
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="nacosx-heartbeat", daemon=True)
+                self._thread.start()
+            elif self._heap[0] is entry:
+                # Only an earlier deadline requires the sleeping scheduler to re-arm its wait
+                self._cond.notify_all()
+
+    def unregister(self, service: "NacosService", timeout: Optional[float] = None) -> None:
+        """Stop heartbeats for a service, waiting up to timeout for an in-flight beat to finish."""
+        with self._cond:
+            # No wakeup needed: the stale heap entry is dropped lazily when it comes due
+            self._active.pop(id(service), None)
+            if threading.current_thread() is not self._thread:
+                self._cond.wait_for(lambda: id(service) not in self._in_flight, timeout)
+
+    def _is_live(self, entry: Tuple[float, int, "NacosService", float]) -> bool:
+        return self._active.get(id(entry[2])) == entry[1]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    # Lazily drop entries of unregistered services
+                    while self._heap and not self._is_live(self._heap[0]):
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        if self._in_flight:
+                            self._cond.wait()  # Finished sends re-push their entries and notify
+                            continue
+                        # Exit; the next register() starts a new thread
+                        self._thread = None
+                        return
+                    remaining = self._heap[0][0] - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                entry = heapq.heappop(self._heap)
+                key = id(entry[2])
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+                # Start another worker only if every idle one already has a queued send to pick up
+                if self._idle_workers <= self._send_queue.qsize() and self._workers < self.SEND_WORKERS:
+                    self._workers += 1
+                    threading.Thread(
+                        target=self._worker, name=f"nacosx-heartbeat-send-{self._workers}", daemon=True
+                    ).start()
+                self._send_queue.put(entry)
+
+    def _worker(self):
+        """Send worker; a daemon thread that lives for the rest of the process."""
+        while True:
+            with self._cond:
+                self._idle_workers += 1
+            entry = self._send_queue.get()
+            with self._cond:
+                self._idle_workers -= 1
+            self._send(*entry)
+
+    def _send(self, fire_time: float, seq: int, service: "NacosService", grid: float) -> None:
+        """Send one heartbeat on a worker thread and reschedule the service."""
+        retry_after = 0.0
+        try:
+            retry_after = service._send_heartbeat_once()
+        except Exception:
+            pass  # Failures are handled and logged by the service itself
+
+        # Beats stay on a fixed grid; a late beat skips the slots it missed instead of bursting
+        now = time.monotonic()
+        interval = service.heartbeat_interval
+        next_grid = grid + ((now - grid) // interval + 1) * interval
+        if 0 < retry_after and now + retry_after < next_grid:
+            next_time = now + retry_after  # Early retry of a failed beat; the grid stays put
+        else:
+            next_time, grid = next_grid, next_grid
+        with self._cond:
+            key = id(service)
+            if self._in_flight[key] > 1:
+                self._in_flight[key] -= 1
+            else:
+                del self._in_flight[key]
+            if self._active.get(key) == seq:
+                heapq.heappush(self._heap, (next_time, seq, service, grid))
+            self._cond.notify_all()
 
 
 class NacosService:
@@ -42,6 +254,7 @@ class NacosService:
         logger=None,
         register_retries=DEFAULT_REGISTER_RETRIES,
         register_retry_delay=DEFAULT_REGISTER_RETRY_DELAY,
+        register_retry_cap=DEFAULT_REGISTER_RETRY_CAP,
         heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL,
         heartbeat_max_failures=DEFAULT_HEARTBEAT_MAX_FAILURES,
         heartbeat_retry_delay=DEFAULT_HEARTBEAT_RETRY_DELAY,
@@ -61,7 +274,8 @@ class NacosService:
             password: Nacos password for authentication
             logger: Custom logger instance
             register_retries: Maximum registration retry attempts
-            register_retry_delay: Delay between registration retries (seconds)
+            register_retry_delay: Base delay for exponential backoff between registration retries (seconds)
+            register_retry_cap: Upper bound of the backoff delay between retries (seconds)
             heartbeat_interval: Heartbeat interval (seconds)
             heartbeat_max_failures: Max consecutive heartbeat failures before re-registration
             heartbeat_retry_delay: Delay between heartbeat retries (seconds)
@@ -71,157 +285,243 @@ class NacosService:
         self.service_name = service_name
         self.service_ip = service_ip
         self.service_port = service_port
+        # Identity strings for log lines, built once since these fields never change
+        self._endpoint = f"{service_ip}:{service_port}"
+        self._id_str = f"{service_name} {self._endpoint}"
         self.ephemeral = ephemeral
         self.metadata = metadata or {}
         self.username = username
         self.password = password
         self.logger = logger
+        # Resolve log methods once instead of dispatching on the level string per call
+        if logger:
+            self._log_fns: Dict[str, Optional[Callable]] = {lvl: getattr(logger, lvl, None) for lvl in _LOG_LEVELS}
+        else:
+            # Fallback to print to avoid losing logs
+            self._log_fns = dict.fromkeys(_LOG_LEVELS, print)
         self.register_retries = register_retries
         self.register_retry_delay = register_retry_delay
+        self.register_retry_cap = register_retry_cap
         self.heartbeat_interval = heartbeat_interval
         self.heartbeat_max_failures = heartbeat_max_failures
         self.heartbeat_retry_delay = heartbeat_retry_delay
 
         self._client: Optional[Any] = None
-        self._heartbeat_thread = None
         self._heartbeat_stop = threading.Event()
-        self._lock = threading.RLock()
-        self._registered = False
+        self._stop_requested = threading.Event()  # Set by stop(), never cleared by start()
+        self._healing_thread: Optional[threading.Thread] = None
+        self._instances_cache: Optional[Tuple[float, Any]] = None  # (monotonic timestamp, list_naming_instance result)
+        self._hb_fail_count = 0  # Consecutive failures since the last (re-)registration
+        self._hb_outage_failures = 0  # Consecutive failures since the last successful heartbeat
+        self._hb_was_failing = False  # Track if we were in a failing state
+        self._hb_suppressed_warnings = 0
+        self._heal_failures = 0  # Consecutive failed self-healing attempts, for error rate-limiting
+        # Guards client initialization only; nothing else is acquired while it is held, so no RLock
+        self._lock = threading.Lock()
+        self._registered_flag = threading.Event()
+        self._deregister_lock = threading.Lock()
         self._orig_sigint = None
         self._orig_sigterm = None
+        self._shutdown_event = threading.Event()
+        self._shutdown_worker: Optional[threading.Thread] = None
+        self._shutdown_worker_done = False
 
     def _log(self, level: str, *args):
         """Internal logging helper."""
-        if self.logger:
-            if level == "info":
-                self.logger.info(" ".join(map(str, args)))
-            elif level == "warning":
-                self.logger.warning(" ".join(map(str, args)))
-            elif level == "error":
-                self.logger.error(" ".join(map(str, args)))
-            else:
-                self.logger.debug(" ".join(map(str, args)))
-        else:
-            # Fallback to print to avoid losing logs
-            print(*args)
+        if level not in self._log_fns:
+            level = "debug"
+        fn = self._log_fns[level]
+        if fn is None:
+            fn = getattr(self.logger, level)  # Logger lacks this level: fail at use, not at init
+        fn(" ".join(map(str, args)))
+
+    def _log_traceback(self):
+        """Log the current traceback at debug level, formatting it only if debug output is enabled."""
+        is_enabled_for = getattr(self.logger, "isEnabledFor", None)
+        if is_enabled_for is not None and not is_enabled_for(logging.DEBUG):
+            return
+        self._log("debug", traceback.format_exc())
+
+    def _backoff_delay(self, base: float, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for the given attempt (1-based)."""
+        return random.uniform(0, min(self.register_retry_cap, base * (2 ** (attempt - 1))))
 
     def _init_client(self):
-        """Initialize Nacos client (thread-safe)."""
+        """Initialize Nacos client (thread-safe, double-checked)."""
+        # Fast path: the client is assigned once, and attribute reads are atomic under the GIL
+        if self._client is not None:
+            return
         with self._lock:
             if self._client is None:
-                if nacos is None:
-                    raise ImportError("nacos-sdk-python is not installed. Install it with: pip install nacos-sdk-python")
-                self._client = nacos.NacosClient(
-                    self.nacos_addr,
-                    namespace=self.namespace,
-                    username=self.username,
-                    password=self.password
-                )
+                self._client = _get_shared_client(self.nacos_addr, self.namespace, self.username, self.password)
                 self._log("info", "✓ Nacos client initialized successfully")
 
-    def _register_once(self) -> bool:
-        """Attempt to register service once."""
+    def _register_once(self, verbose: bool = True) -> bool:
+        """Attempt to register service once; verbose=False silences its log lines."""
         try:
-            with self._lock:
-                self._client.add_naming_instance(  # type: ignore
-                    self.service_name,
-                    self.service_ip,
-                    self.service_port,
-                    ephemeral=self.ephemeral,
-                    metadata=self.metadata
-                )
-            self._registered = True
-            self._log("info", f"✓ Service registered to Nacos: {self.service_name} {self.service_ip}:{self.service_port}")
+            client = self._client
+            client.add_naming_instance(  # type: ignore
+                self.service_name,
+                self.service_ip,
+                self.service_port,
+                ephemeral=self.ephemeral,
+                metadata=self.metadata
+            )
+            self._registered_flag.set()
+            if verbose:
+                self._log("info", f"✓ Service registered to Nacos: {self._id_str}")
             return True
         except Exception as e:
-            self._log("warning", f"⚠ Failed to register to Nacos: {e}")
-            self._log("debug", traceback.format_exc())
+            if verbose:
+                self._log("warning", f"⚠ Failed to register to Nacos: {e}")
+                self._log_traceback()
             return False
 
-    def register_with_retry(self, retries: Optional[int] = None, delay: Optional[float] = None) -> bool:
-        """Register service with retry mechanism."""
+    def register_with_retry(self, retries: Optional[int] = None, delay: Optional[float] = None, verbose: bool = True) -> bool:
+        """Register service with retry mechanism; returns False early if stop() is called meanwhile."""
         retries = self.register_retries if retries is None else retries
         delay = self.register_retry_delay if delay is None else delay
 
         self._init_client()
         for attempt in range(1, retries + 1):
-            ok = self._register_once()
+            ok = self._register_once(verbose)
             if ok:
                 return True
             if attempt < retries:
-                self._log("info", f"⚙ Registration attempt {attempt}/{retries} failed, retrying in {delay}s")
-                time.sleep(delay)
+                sleep_time = self._backoff_delay(delay, attempt)
+                if verbose:
+                    self._log("info", f"⚙ Registration attempt {attempt}/{retries} failed, retrying in {sleep_time:.2f}s")
+                # Interruptible wait so stop() cancels pending retries immediately
+                if self._heartbeat_stop.wait(sleep_time):
+                    return False
         return False
 
     def _remove_once(self) -> bool:
         """Attempt to deregister service once."""
         try:
-            with self._lock:
-                self._client.remove_naming_instance(self.service_name, self.service_ip, self.service_port)  # type: ignore
-            self._registered = False
-            self._log("info", "✓ Service deregistered from Nacos")
+            client = self._client
+            client.remove_naming_instance(self.service_name, self.service_ip, self.service_port)  # type: ignore
+            self._registered_flag.clear()
+            self._log("info", f"✓ Service deregistered from Nacos: {self._id_str}")
             return True
         except Exception as e:
             self._log("warning", f"⚠ Failed to deregister from Nacos: {e}")
-            self._log("debug", traceback.format_exc())
+            self._log_traceback()
             return False
 
-    def _heartbeat_loop(self):
-        """Heartbeat thread main loop with retry and self-healing."""
-        fail_count = 0
-        was_failing = False  # Track if we were in a failing state
-        while not self._heartbeat_stop.is_set():
-            # Wait with interrupt support
-            is_stopped = self._heartbeat_stop.wait(self.heartbeat_interval)
-            if is_stopped:
-                break
-            if not self.ephemeral:
-                continue  # Permanent instances don't need heartbeat
-            
-            try:
-                with self._lock:
-                    self._client.send_heartbeat(self.service_name, self.service_ip, self.service_port)  # type: ignore
-                fail_count = 0
-                
-                # Show recovery message if we were previously failing
-                if was_failing:
+    def _send_heartbeat_once(self) -> float:
+        """
+        Send a single heartbeat, called by the shared heartbeat scheduler.
+
+        Returns:
+            Delay (seconds) before an early retry of a failed beat; 0 waits for the next regular beat.
+        """
+        if self._healing_thread is not None and self._healing_thread.is_alive():
+            return 0  # Re-registration in progress, skip this beat
+
+        try:
+            self._client.send_heartbeat(self.service_name, self.service_ip, self.service_port)  # type: ignore
+            self._hb_fail_count = 0
+            self._hb_outage_failures = 0
+
+            # Show recovery message if we were previously failing
+            if self._hb_was_failing:
+                if self._hb_suppressed_warnings:
+                    self._log("info", f"✓ Nacos connection recovered ({self._hb_suppressed_warnings} repeated heartbeat warnings suppressed)")
+                else:
                     self._log("info", "✓ Nacos connection recovered")
-                    was_failing = False
-                    
-                # Optional debug logging
-                # self._log("debug", "✓ Heartbeat sent successfully")
-            except Exception as e:
-                # Mark that we're in a failing state
-                was_failing = True
-                fail_count += 1
-                self._log("warning", f"⚠ Heartbeat failed ({fail_count}/{self.heartbeat_max_failures}): {e}")
-                self._log("debug", traceback.format_exc())
-                
-                # Wait before retry
-                if self._heartbeat_stop.wait(self.heartbeat_retry_delay):
-                    break
-                
-                # Self-healing: re-register after max failures
-                if fail_count >= self.heartbeat_max_failures:
+                self._hb_was_failing = False
+                self._hb_suppressed_warnings = 0
+                self._heal_failures = 0
+
+            # Optional debug logging
+            # self._log("debug", "✓ Heartbeat sent successfully")
+            return 0
+        except Exception as e:
+            # Mark that we're in a failing state
+            self._hb_was_failing = True
+            self._hb_fail_count += 1
+            self._hb_outage_failures += 1
+            fail_count = self._hb_fail_count
+            outage_failures = self._hb_outage_failures
+            # Log at outage failures 1, 2, 4, 8, ... (and at the self-healing threshold) to avoid
+            # flooding; the count survives self-healing cycles and only resets on a real recovery
+            verbose = (
+                outage_failures & (outage_failures - 1) == 0
+                or outage_failures == self.heartbeat_max_failures
+            )
+            if verbose:
+                self._log("warning", f"⚠ Heartbeat failed for {self._id_str} ({fail_count}/{self.heartbeat_max_failures}): {e}")
+                self._log_traceback()
+            else:
+                self._hb_suppressed_warnings += 1
+
+            # Self-healing: re-register after max failures, off the scheduler thread
+            if fail_count >= self.heartbeat_max_failures:
+                if verbose:
                     self._log("warning", "⚠ Detected consecutive heartbeat failures, attempting service re-registration (self-healing)")
-                    try:
-                        # Try to remove first (may fail)
-                        try:
-                            with self._lock:
-                                self._client.remove_naming_instance(self.service_name, self.service_ip, self.service_port)  # type: ignore
-                        except Exception:
-                            pass  # Ignore remove errors
-                        
-                        # Re-register with retry
-                        ok = self.register_with_retry()
-                        if ok:
-                            self._log("info", "✓ Self-healing: Re-registration successful, heartbeat failure count reset")
-                            fail_count = 0
-                        else:
-                            self._log("error", "✗ Self-healing: Re-registration failed, will continue trying in background")
-                    except Exception as e2:
-                        self._log("error", f"✗ Exception during self-healing process: {e2}")
-                        self._log("debug", traceback.format_exc())
+                self._healing_thread = threading.Thread(target=self._self_heal, args=(verbose,), daemon=True)
+                self._healing_thread.start()
+
+            # Retry after a jittered exponential backoff; the scheduler only uses it when it comes
+            # before the next regular beat, so the gap between beats never exceeds one interval
+            return self._backoff_delay(self.heartbeat_retry_delay, fail_count)
+
+    def _is_registered_on_server(self) -> bool:
+        """Check whether Nacos still lists this instance as healthy (result cached briefly)."""
+        now = time.monotonic()
+        cached = self._instances_cache
+        if cached is not None and now - cached[0] < min(self.heartbeat_interval, 5):
+            result = cached[1]
+        else:
+            result = self._client.list_naming_instance(self.service_name)  # type: ignore
+            self._instances_cache = (now, result)
+
+        hosts = result.get("hosts") if isinstance(result, dict) else None
+        return any(
+            host.get("ip") == self.service_ip
+            and int(host.get("port", -1)) == self.service_port
+            and host.get("healthy")
+            for host in hosts or ()
+        )
+
+    def _self_heal(self, verbose: bool = True):
+        """Remove and re-register the instance after consecutive heartbeat failures."""
+        # The server may merely have been slow: skip the remove/add round trips if we're still listed
+        try:
+            if self._is_registered_on_server():
+                if verbose:
+                    self._log("info", "✓ Self-healing: server-side registration verified, skipping re-add")
+                self._hb_fail_count = 0
+                self._heal_failures = 0
+                return
+        except Exception:
+            pass  # Fall back to re-registration
+
+        try:
+            # Try to remove first (may fail)
+            try:
+                self._client.remove_naming_instance(self.service_name, self.service_ip, self.service_port)  # type: ignore
+            except Exception:
+                pass  # Ignore remove errors
+
+            # Re-register with retry
+            ok = self.register_with_retry(verbose=verbose)
+            if ok:
+                if verbose:
+                    self._log("info", "✓ Self-healing: Re-registration successful, heartbeat failure count reset")
+                self._hb_fail_count = 0
+                self._heal_failures = 0
+            else:
+                self._heal_failures += 1
+                # Rate-limited on their own count (1, 2, 4, 8, ...) rather than by verbose
+                if self._heal_failures & (self._heal_failures - 1) == 0:
+                    self._log("error", f"✗ Self-healing: Re-registration failed ({self._heal_failures} attempts), will continue trying in background")
+        except Exception as e:
+            self._heal_failures += 1
+            if self._heal_failures & (self._heal_failures - 1) == 0:
+                self._log("error", f"✗ Exception during self-healing process ({self._heal_failures} attempts): {e}")
+                self._log_traceback()
 
     def start(self) -> None:
         """
@@ -230,44 +530,85 @@ class NacosService:
         Raises:
             RuntimeError: If registration fails after all retries (optional, based on external handling)
         """
-        self._init_client()
-        ok = self.register_with_retry()
+        # Reset any earlier stop; self-healing calls register_with_retry directly and keeps it
+        self._heartbeat_stop.clear()
+        ok = self.register_with_retry()  # Initializes the client on first use
         if not ok:
-            self._log("error", "✗ Service registration failed after multiple attempts")
+            if not self._heartbeat_stop.is_set():
+                self._log("error", "✗ Service registration failed after multiple attempts")
             return
         
-        # Start heartbeat thread (only for ephemeral instances)
+        # Schedule heartbeats on the shared scheduler thread (only for ephemeral instances)
         if self.ephemeral:
-            self._heartbeat_stop.clear()
-            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
-            self._heartbeat_thread.start()
-            self._log("info", f"✓ Heartbeat thread started (interval: {self.heartbeat_interval}s)")
+            self._hb_fail_count = 0
+            self._hb_outage_failures = 0
+            self._hb_was_failing = False
+            self._hb_suppressed_warnings = 0
+            self._heal_failures = 0
+            _HeartbeatScheduler.instance().register(self)
+            self._log("info", f"✓ Heartbeat scheduled (interval: {self.heartbeat_interval}s)")
+
+    def register_deferred(self, delay: float = 0) -> None:
+        """Queue this service for registration by the first flush_registrations() call after delay seconds."""
+        ready_at = time.monotonic() + delay
+        with _PENDING_LOCK:
+            _PENDING_REGISTRATIONS[self] = max(ready_at, _PENDING_REGISTRATIONS.get(self, ready_at))
 
     def stop(self, unregister_timeout: float = DEFAULT_UNREGISTER_TIMEOUT) -> None:
-        """Stop heartbeat thread and deregister service."""
+        """Stop heartbeats and deregister service."""
+        self._stop_requested.set()
+        with _PENDING_LOCK:
+            _PENDING_REGISTRATIONS.pop(self, None)
+
         try:
-            if self._heartbeat_thread and self._heartbeat_thread.is_alive():
-                self._heartbeat_stop.set()
-                self._heartbeat_thread.join(timeout=unregister_timeout)
+            self._heartbeat_stop.set()
+            _HeartbeatScheduler.instance().unregister(self, timeout=unregister_timeout)
+            if self._healing_thread and self._healing_thread.is_alive():
+                self._healing_thread.join(timeout=unregister_timeout)
         except Exception as e:
-            self._log("warning", f"⚠ Exception while stopping heartbeat thread: {e}")
+            self._log("warning", f"⚠ Exception while stopping heartbeat: {e}")
         
+        # Shutdown may be triggered from both the signal worker and the caller: claim the
+        # deregistration atomically so only one of them performs it
+        with self._deregister_lock:
+            if not self._registered_flag.is_set():
+                return
+            self._registered_flag.clear()
         try:
-            self._remove_once()
+            ok = self._remove_once()
         except Exception:
-            pass
+            ok = False
+        if not ok:
+            self._registered_flag.set()  # Let a later stop() retry
+
+    def _shutdown_worker_loop(self):
+        """Run stop() off the signal handler once an exit signal has been received."""
+        self._shutdown_event.wait()
+        if self._shutdown_worker_done:
+            return  # Signal handlers were restored without a signal arriving
+        try:
+            self.stop()
+        except Exception as e:
+            self._log("error", f"✗ Graceful shutdown failed: {e}")
 
     def install_signal_handlers(self):
         """Install signal handlers for graceful shutdown."""
         def _handle(signum, frame):
+            # Deregistration is blocking network I/O, so hand it to the shutdown worker
             self._log("info", f"⚙ Received exit signal ({signum}), preparing graceful shutdown...")
-            try:
-                self.stop()
-            except Exception as e:
-                self._log("error", f"✗ Graceful shutdown failed: {e}")
-            
+            self._shutdown_event.set()
+            # The worker is a daemon thread: give it a bounded window to deregister before exiting
+            worker = self._shutdown_worker
+            if worker is not None and worker is not threading.current_thread():
+                worker.join(timeout=DEFAULT_SHUTDOWN_TIMEOUT)
+
             # Call original handler if exists
-            orig = {signal.SIGINT: self._orig_sigint, signal.SIGTERM: self._orig_sigterm}.get(signum)
+            if signum == signal.SIGINT:
+                orig = self._orig_sigint
+            elif signum == signal.SIGTERM:
+                orig = self._orig_sigterm
+            else:
+                orig = None
             if orig:
                 if callable(orig):
                     try:
@@ -290,6 +631,15 @@ class NacosService:
             self._log("info", "✓ Graceful shutdown signal handlers installed")
         except Exception as e:
             self._log("warning", f"⚠ Failed to install signal handlers: {e}")
+            return
+
+        if self._shutdown_worker is None or not self._shutdown_worker.is_alive():
+            self._shutdown_event.clear()
+            self._shutdown_worker_done = False
+            self._shutdown_worker = threading.Thread(
+                target=self._shutdown_worker_loop, name="nacosx-shutdown", daemon=True
+            )
+            self._shutdown_worker.start()
 
     def restore_signal_handlers(self):
         """Restore original signal handlers."""
@@ -302,6 +652,10 @@ class NacosService:
         except Exception as e:
             self._log("warning", f"⚠ Failed to restore signal handlers: {e}")
 
+        # Release the shutdown worker if no signal arrived
+        self._shutdown_worker_done = True
+        self._shutdown_event.set()
+
     def __enter__(self):
         """Context manager entry."""
         self.install_signal_handlers()
@@ -317,13 +671,23 @@ class NacosService:
         finally:
             self.restore_signal_handlers()
 
+    async def __aenter__(self):
+        """Async context manager entry; client initialization runs in the default executor."""
+        import asyncio
 
-def _call_func(func: Callable, is_coroutine: bool, *args, **kwargs):
-    """Helper to call function (sync or async)."""
-    if is_coroutine:
-        return func(*args, **kwargs)
-    else:
-        return func(*args, **kwargs)
+        # Signal handlers can only be installed from the main thread, so keep this on the loop thread
+        self.install_signal_handlers()
+        await asyncio.get_running_loop().run_in_executor(None, self._init_client)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit; deregistration runs in the default executor."""
+        import asyncio
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.stop)
+        finally:
+            self.restore_signal_handlers()
 
 
 def nacos_registry(
@@ -343,6 +707,8 @@ def nacos_registry(
     raise_on_register_fail: bool = True,
     register_retries: int = DEFAULT_REGISTER_RETRIES,
     register_retry_delay: int = DEFAULT_REGISTER_RETRY_DELAY,
+    register_retry_cap: int = DEFAULT_REGISTER_RETRY_CAP,
+    defer: bool = False,
 ):
     """
     Enhanced Nacos registration decorator.
@@ -365,99 +731,129 @@ def nacos_registry(
         logger: Custom logger instance
         raise_on_register_fail: Raise exception on registration failure
         register_retries: Maximum registration retry attempts
-        register_retry_delay: Delay between registration retries
+        register_retry_delay: Base delay for registration retry backoff
+        register_retry_cap: Upper bound of the registration retry backoff delay
+        defer: Queue registration so that services started together are registered in one round
     
     Returns:
         Decorated function
     """
     def decorator(func: Callable):
-        is_coroutine = asyncio.iscoroutinefunction(func)
+        if not enabled:
+            return func
 
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            if not enabled:
-                return _call_func(func, is_coroutine, *args, **kwargs)
+        import asyncio
 
-            # Parse service_addr
-            if not nacos_addr:
-                msg = "Nacos nacos_addr is required"
-                if raise_on_register_fail:
-                    raise ValueError(msg)
-                else:
-                    print("⚠", msg)
-                    return _call_func(func, is_coroutine, *args, **kwargs)
-            
-            if not service_name:
-                msg = "Nacos service_name is required"
-                if raise_on_register_fail:
-                    raise ValueError(msg)
-                else:
-                    print("⚠", msg)
-                    return _call_func(func, is_coroutine, *args, **kwargs)
-            
-            if not service_addr or ':' not in service_addr:
-                msg = f"Nacos configuration incomplete or service_addr format error: {service_addr}"
-                if raise_on_register_fail:
-                    raise ValueError(msg)
-                else:
-                    print("⚠", msg)
-                    return _call_func(func, is_coroutine, *args, **kwargs)
+        is_coroutine = asyncio.iscoroutinefunction(func)
 
+        # Validate configuration and parse service_addr once, at decoration time
+        config_error = None
+        service_ip, service_port = "", 0
+        if not nacos_addr:
+            config_error = "Nacos nacos_addr is required"
+        elif not service_name:
+            config_error = "Nacos service_name is required"
+        elif not service_addr or ':' not in service_addr:
+            config_error = f"Nacos configuration incomplete or service_addr format error: {service_addr}"
+        else:
             service_ip, port_str = service_addr.rsplit(':', 1)
             try:
                 service_port = int(port_str)
             except ValueError:
-                msg = f"Failed to parse port from service_addr: {service_addr}"
+                config_error = f"Failed to parse port from service_addr: {service_addr}"
+
+        make_service = partial(
+            NacosService,
+            nacos_addr=nacos_addr,
+            namespace=namespace,
+            service_name=service_name,
+            service_ip=service_ip,
+            service_port=service_port,
+            ephemeral=ephemeral,
+            metadata=metadata,
+            username=username,
+            password=password,
+            logger=logger,
+            register_retries=register_retries,
+            register_retry_delay=register_retry_delay,
+            register_retry_cap=register_retry_cap,
+            heartbeat_interval=heartbeat_interval,
+            heartbeat_max_failures=heartbeat_max_failures,
+            heartbeat_retry_delay=heartbeat_retry_delay,
+        )
+
+        def _setup() -> Optional[NacosService]:
+            """Create the service and schedule registration; None means run unregistered."""
+            if config_error:
                 if raise_on_register_fail:
-                    raise ValueError(msg)
-                else:
-                    print("⚠", msg)
-                    return _call_func(func, is_coroutine, *args, **kwargs)
+                    raise ValueError(config_error)
+                print("⚠", config_error)
+                return None
 
-            # Create NacosService instance
-            nacos_svc = NacosService(
-                nacos_addr=nacos_addr,
-                namespace=namespace,
-                service_name=service_name,
-                service_ip=service_ip,
-                service_port=service_port,
-                ephemeral=ephemeral,
-                metadata=metadata,
-                username=username,
-                password=password,
-                logger=logger,
-                register_retries=register_retries,
-                register_retry_delay=register_retry_delay,
-                heartbeat_interval=heartbeat_interval,
-                heartbeat_max_failures=heartbeat_max_failures,
-                heartbeat_retry_delay=heartbeat_retry_delay,
-            )
+            nacos_svc = make_service()
 
             # Install signal handlers first
             nacos_svc.install_signal_handlers()
-            
+
+            if defer:
+                # Flushed together with any other services whose startup delay has also expired
+                nacos_svc.register_deferred(delay=_STARTUP_DELAY)
+
             # For long-running services, we need to register immediately but in a non-blocking way
             def delayed_registration():
-                # Longer delay to ensure service has fully started
-                time.sleep(5)
-                try:
-                    nacos_svc.start()
-                except Exception as e:
-                    nacos_svc._log("error", f"✗ Failed to register service: {e}")
-            
+                # Longer delay to ensure service has fully started; give up if it already returned
+                if nacos_svc._stop_requested.wait(_STARTUP_DELAY):
+                    return
+                if defer:
+                    flush_registrations()
+                else:
+                    try:
+                        nacos_svc.start()
+                    except Exception as e:
+                        nacos_svc._log("error", f"✗ Failed to register service: {e}")
+                # The function may have returned while we were registering: undo it
+                if nacos_svc._stop_requested.is_set():
+                    nacos_svc.stop()
+
             # Start registration in a separate thread so it doesn't block service startup
             registration_thread = threading.Thread(target=delayed_registration, daemon=True)
             registration_thread.start()
-            
+            return nacos_svc
+
+        def _teardown(nacos_svc: NacosService) -> None:
             try:
-                # Execute the actual service function
-                result = _call_func(func, is_coroutine, *args, **kwargs)
-                return result
+                nacos_svc.stop()
             finally:
+                nacos_svc.restore_signal_handlers()
+
+        if is_coroutine:
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                nacos_svc = _setup()
+                if nacos_svc is None:
+                    return await func(*args, **kwargs)
                 try:
-                    nacos_svc.stop()
+                    # Await inside the registration scope so the service stays registered while running
+                    return await func(*args, **kwargs)
                 finally:
-                    nacos_svc.restore_signal_handlers()
+                    # Deregistration is network I/O, so keep it off the event loop
+                    try:
+                        await asyncio.get_running_loop().run_in_executor(None, nacos_svc.stop)
+                    finally:
+                        nacos_svc.restore_signal_handlers()
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            nacos_svc = _setup()
+            if nacos_svc is None:
+                return func(*args, **kwargs)
+            try:
+                # Execute the actual service function
+                return func(*args, **kwargs)
+            finally:
+                _teardown(nacos_svc)
 
         return wrapper
     return decorator
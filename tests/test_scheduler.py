@@ -0,0 +1,208 @@
+"""Tests for the shared heartbeat scheduler, run against a fake nacos client."""
+
+import logging
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+import types
+
+import pytest
+
+from nacosx import core
+from nacosx.core import NacosService, _HeartbeatScheduler
+
+NACOS_ADDR = "127.0.0.1:8848"
+
+
+class FakeNacosClient:
+    """Records heartbeats; per service name, a heartbeat can be made to block."""
+
+    def __init__(self, server_addresses, namespace=None, username=None, password=None):
+        self.beats = []  # (monotonic time, service name)
+        self.beat_delay = {}  # service name -> seconds each heartbeat blocks for
+
+    def add_naming_instance(self, service_name, ip, port, ephemeral=True, metadata=None):
+        return True
+
+    def remove_naming_instance(self, service_name, ip, port):
+        return True
+
+    def send_heartbeat(self, service_name, ip, port):
+        self.beats.append((time.monotonic(), service_name))
+        delay = self.beat_delay.get(service_name)
+        if delay:
+            time.sleep(delay)
+        return {}
+
+    def list_naming_instance(self, service_name):
+        return {"hosts": []}
+
+    def beats_of(self, service_name):
+        return [t for t, name in self.beats if name == service_name]
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """A fresh scheduler whose services talk to a FakeNacosClient."""
+    fake_nacos = types.ModuleType("nacos")
+    fake_nacos.NacosClient = FakeNacosClient
+    monkeypatch.setitem(sys.modules, "nacos", fake_nacos)
+    monkeypatch.setattr(_HeartbeatScheduler, "_instance", None)
+    core.close_shared_clients()
+    yield _HeartbeatScheduler.instance()
+    core.close_shared_clients()
+
+
+@pytest.fixture
+def client(scheduler):
+    return core._get_shared_client(NACOS_ADDR, None, None, None)
+
+
+def make_service(name, interval, port=8000):
+    return NacosService(
+        NACOS_ADDR,
+        None,
+        name,
+        "127.0.0.1",
+        port,
+        logger=logging.getLogger("nacosx.test"),
+        heartbeat_interval=interval,
+    )
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_services_beat_at_their_own_interval(scheduler, client):
+    fast, slow = make_service("fast", 0.1), make_service("slow", 0.3)
+    fast.start()
+    slow.start()
+    time.sleep(0.65)
+    fast.stop()
+    slow.stop()
+
+    assert 5 <= len(client.beats_of("fast")) <= 7
+    assert len(client.beats_of("slow")) == 2
+    # One scheduler thread serves both services
+    assert len([t for t in threading.enumerate() if t.name == "nacosx-heartbeat"]) <= 1
+
+
+def test_stopped_service_entry_is_dropped_lazily(scheduler, client):
+    service = make_service("svc", 0.2)
+    service.start()
+    service.stop()
+
+    # unregister() only forgets the entry; it stays in the heap until it comes due
+    assert id(service) not in scheduler._active
+    assert len(scheduler._heap) == 1
+
+    assert wait_until(lambda: not scheduler._heap)
+    assert client.beats_of("svc") == []
+
+
+def test_thread_exits_when_idle_and_restarts_on_register(scheduler, client):
+    first = make_service("first", 0.05)
+    first.start()
+    thread = scheduler._thread
+    assert thread is not None and thread.is_alive()
+    first.stop()
+    assert wait_until(lambda: scheduler._thread is None)
+    thread.join(timeout=1)
+    assert not thread.is_alive()
+
+    second = make_service("second", 0.05)
+    second.start()
+    assert scheduler._thread is not None and scheduler._thread is not thread
+    assert wait_until(lambda: len(client.beats_of("second")) >= 2)
+    second.stop()
+
+
+def test_in_flight_beat_bounds_the_unregister_wait(scheduler, client):
+    client.beat_delay["slow"] = 1.0
+    service = make_service("slow", 0.05)
+    service.start()
+    assert wait_until(lambda: id(service) in scheduler._in_flight)
+    assert scheduler._in_flight[id(service)] == 1
+
+    started = time.monotonic()
+    service.stop(unregister_timeout=0.2)
+    assert 0.15 <= time.monotonic() - started < 0.8
+
+    # The finished beat is not rescheduled for a stopped service
+    assert wait_until(lambda: not scheduler._in_flight)
+    assert not scheduler._heap
+    assert len(client.beats_of("slow")) == 1
+
+
+def test_register_wakes_scheduler_while_unregister_waits(scheduler, client):
+    client.beat_delay["slow"] = 2.0
+    idle = make_service("idle", 30, port=8001)
+    idle.start()  # Keeps the scheduler asleep on a far-away deadline
+    slow = make_service("slow", 0.05, port=8002)
+    slow.start()
+    assert wait_until(lambda: id(slow) in scheduler._in_flight)
+
+    # Blocks on the scheduler's condition until the slow beat finishes
+    stopper = threading.Thread(target=slow.stop, kwargs={"unregister_timeout": 3})
+    stopper.start()
+    time.sleep(0.1)
+    # An earlier deadline re-arms the scheduler's wait, queueing it behind the stopper
+    sooner = make_service("sooner", 20, port=8004)
+    sooner.start()
+    time.sleep(0.1)
+
+    fast = make_service("fast", 0.3, port=8003)
+    registered = time.monotonic()
+    fast.start()
+    try:
+        assert wait_until(lambda: client.beats_of("fast"), timeout=1.0)
+        assert client.beats_of("fast")[0] - registered < 0.6
+    finally:
+        fast.stop()
+        sooner.stop()
+        idle.stop()
+        stopper.join()
+
+
+def test_hung_heartbeat_does_not_block_exit(tmp_path):
+    script = tmp_path / "hung_heartbeat.py"
+    script.write_text(textwrap.dedent("""
+        import sys, time, types
+
+        class NacosClient:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def add_naming_instance(self, *args, **kwargs):
+                return True
+
+            def send_heartbeat(self, *args, **kwargs):
+                time.sleep(30)  # An unreachable server
+
+        sys.modules["nacos"] = types.ModuleType("nacos")
+        sys.modules["nacos"].NacosClient = NacosClient
+
+        import logging
+        from nacosx import NacosService
+
+        service = NacosService(
+            "127.0.0.1:8848", None, "hung", "127.0.0.1", 8000,
+            logger=logging.getLogger("hung"), heartbeat_interval=0.05,
+        )
+        service.start()
+        time.sleep(0.3)
+    """))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    started = time.monotonic()
+    subprocess.run([sys.executable, str(script)], env=env, check=True, timeout=20)
+    assert time.monotonic() - started < 5